@@ -136,7 +136,10 @@ export const api = {
     console.log(`📦 Detected binary format version: ${version}`);
 
     let parsedData;
-    if (version === 3) {
+    if (version === 4) {
+      // Version 4: NBBO format with exchange snapshots, column-oriented
+      return parseBinaryDataV4(decompressed);
+    } else if (version === 3) {
       // Version 3: NBBO format with exchange snapshots
       parsedData = parseBinaryDataV3(decompressed);
       // V3 already has proper timestamps, no preprocessing needed
@@ -443,6 +446,134 @@ function parseBinaryDataV3(buffer) {
   return data;
 }
 
+function parseBinaryDataV4(buffer) {
+  // Version 4 binary format (NBBO with exchange snapshots, column-oriented):
+  // Header: identical to version 3 (magic, version, interval, samples, timestamp, publisher map)
+  // Columns, num_samples little-endian values each:
+  //   - time_delta_ms, nbbo_bid, nbbo_ask, nbbo_bid_size, nbbo_ask_size (int32)
+  //   - best_bid_pub, best_ask_pub (uint8)
+  //   - per publisher index: present (uint8), bid, ask (int32), bid_size, ask_size (uint32)
+  // All bid/ask price columns are deltas from the previous sample (first one from zero).
+
+  const dataView = new DataView(buffer.buffer, buffer.byteOffset, buffer.byteLength);
+  let offset = 6; // Skip magic + version
+
+  const resampleIntervalMs = dataView.getUint16(offset, true);
+  offset += 2;
+
+  const numSamples = dataView.getUint32(offset, true);
+  offset += 4;
+
+  const initialTimestampUs = dataView.getBigUint64(offset, true);
+  offset += 8;
+
+  const publisherMapLength = dataView.getUint16(offset, true);
+  offset += 2;
+
+  const publisherMapBytes = buffer.slice(offset, offset + publisherMapLength);
+  const publisherMapStr = new TextDecoder().decode(publisherMapBytes);
+  offset += publisherMapLength;
+
+  const publisherMap = {};
+  publisherMapStr.split(',').forEach(pair => {
+    const [idx, pubId] = pair.split(':');
+    publisherMap[parseInt(idx)] = parseInt(pubId);
+  });
+  const numPublishers = Object.keys(publisherMap).length;
+
+  console.log(`📦 Binary V4 format: samples=${numSamples}, interval=${resampleIntervalMs}ms, publishers=`, publisherMap);
+
+  const readColumn = (ArrayType, getter) => {
+    const column = new ArrayType(numSamples);
+    for (let i = 0; i < numSamples; i++) {
+      column[i] = getter(offset + i * ArrayType.BYTES_PER_ELEMENT);
+    }
+    offset += numSamples * ArrayType.BYTES_PER_ELEMENT;
+    return column;
+  };
+  const readInt32 = () => readColumn(Int32Array, (pos) => dataView.getInt32(pos, true));
+  const readUint32 = () => readColumn(Uint32Array, (pos) => dataView.getUint32(pos, true));
+  const readUint8 = () => readColumn(Uint8Array, (pos) => dataView.getUint8(pos));
+  const readDeltaInt32 = () => {
+    const column = readInt32();
+    for (let i = 1; i < numSamples; i++) {
+      column[i] += column[i - 1];
+    }
+    return column;
+  };
+
+  const timeDeltas = readInt32();
+  const nbboBids = readDeltaInt32();
+  const nbboAsks = readDeltaInt32();
+  const nbboBidSizes = readInt32();
+  const nbboAskSizes = readInt32();
+  const bestBidPubs = readUint8();
+  const bestAskPubs = readUint8();
+
+  const exchangeColumns = [];
+  for (let p = 0; p < numPublishers; p++) {
+    exchangeColumns.push({
+      present: readUint8(),
+      bid: readDeltaInt32(),
+      ask: readDeltaInt32(),
+      bidSize: readUint32(),
+      askSize: readUint32()
+    });
+  }
+
+  const data = [];
+  let cumulativeTimestampMs = Number(initialTimestampUs) / 1000;
+
+  for (let i = 0; i < numSamples; i++) {
+    cumulativeTimestampMs += timeDeltas[i];
+
+    const nbboBid = nbboBids[i] / PRICE_SCALE;
+    const nbboAsk = nbboAsks[i] / PRICE_SCALE;
+    const nbboBidSize = nbboBidSizes[i] / SIZE_SCALE;
+    const nbboAskSize = nbboAskSizes[i] / SIZE_SCALE;
+
+    const exchanges = [];
+    for (let p = 0; p < numPublishers; p++) {
+      const columns = exchangeColumns[p];
+      if (!columns.present[i]) continue;
+
+      exchanges.push({
+        publisher_id: publisherMap[p] || p,
+        publisher_index: p,
+        bid_price: (columns.bid[i] / PRICE_SCALE).toFixed(5),
+        ask_price: (columns.ask[i] / PRICE_SCALE).toFixed(5),
+        bid_size: (columns.bidSize[i] / SIZE_SCALE).toFixed(2),
+        ask_size: (columns.askSize[i] / SIZE_SCALE).toFixed(2)
+      });
+    }
+
+    const timestamp = new Date(cumulativeTimestampMs).toISOString();
+    const adjustedTimestamp = cumulativeTimestampMs / 1000;
+
+    data.push({
+      timestamp: timestamp,
+      time: timestamp,
+      adjustedTimestamp: adjustedTimestamp,
+      bid_price: nbboBid.toFixed(5),
+      ask_price: nbboAsk.toFixed(5),
+      bid_size: nbboBidSize.toFixed(2),
+      ask_size: nbboAskSize.toFixed(2),
+      priceBid: nbboBid.toFixed(5),
+      priceAsk: nbboAsk.toFixed(5),
+      sizeBid: nbboBidSize.toFixed(2),
+      sizeAsk: nbboAskSize.toFixed(2),
+      nbbo: true,
+      best_bid_publisher: publisherMap[bestBidPubs[i]],
+      best_ask_publisher: publisherMap[bestAskPubs[i]],
+      exchanges: exchanges
+    });
+  }
+
+  console.log(`✅ Parsed ${data.length} NBBO samples from binary data (Version 4)`);
+
+  return data;
+}
+
 function parseBinaryLevel2Data(buffer) {
   // Structure from Python:
   // Header: uint64 (8 bytes) = initial_timestamp_ms
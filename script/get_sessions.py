@@ -12,14 +12,21 @@ Usage:
 
 import sys
 import os
-import gzip
+import zlib
 import struct
 import shutil
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
+import numpy as np
 import pandas as pd
-import databento as db
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import requests
 
 
 # ============================================================================
@@ -41,6 +48,18 @@ class Config:
         'XBOS.ITCH',     # NASDAQ BX
         'XPSX.ITCH',     # NASDAQ PSX
     ]
+
+    # Identical consecutive rows over these columns are dropped when combining exchanges
+    QUOTE_DEDUP_COLUMNS = ['ts_event', 'publisher_id', 'bid_px_00', 'ask_px_00',
+                           'bid_sz_00', 'ask_sz_00']
+
+    # Upper bound on simultaneous Databento requests (one per exchange dataset)
+    DATABENTO_MAX_CONCURRENT_REQUESTS = 4
+
+    # Retries for transient Databento failures (429 / 5xx / connection errors)
+    DATABENTO_MAX_RETRIES = 4
+    DATABENTO_RETRY_BASE_DELAY = 1.0   # seconds, doubled per attempt
+    DATABENTO_RETRY_MAX_DELAY = 60.0
     
     # Dataset to Publisher ID mapping (Databento standard IDs)
     # Databento's raw data uses venue-specific publisher IDs, so we need to map them
@@ -57,18 +76,35 @@ class Config:
         'XPSX.ITCH': 43,   # NASDAQ PSX
     }
 
+    # Intermediate parquet files
+    PARQUET_COMPRESSION = 'zstd'
+    PARQUET_COMPRESSION_LEVEL = 3
+    PARQUET_ROW_GROUP_SIZE = 256_000
+
+    # Records decoded per batch when converting Databento DBN responses
+    DBN_BATCH_SIZE = 256_000
+    DBN_PRICE_SCALE = 1e9  # DBN prices are fixed-point int64 in units of 1e-9
+    DBN_UNDEF_PRICE = np.iinfo(np.int64).max
+
     # Compression Settings
     PRICE_SCALE = 100_000
     SIZE_SCALE = 100
     TIME_UNIT = 1_000_000
     GZIP_LEVEL = 9
+    GZIP_CHUNK_SIZE = 1 << 20  # Bytes handed to zlib per compress() call
+    ENCODE_WORKERS = os.cpu_count() or 1  # Threads encoding V4 exchange columns
 
     # NBBO Resampling
     NBBO_RESAMPLE_INTERVAL_MS = 100
+    RESAMPLE_BATCH_SIZE = 1_000_000  # MBP-1 rows read per batch while resampling
 
     # Binary Format
     BINARY_MAGIC = b'TICK'
     BINARY_VERSION_V3 = 3
+    BINARY_VERSION_V4 = 4
+    # Version written by NBBOBinaryCompressor. V4 is opt-in: the app reads it, but the
+    # notebook readers (analyze_session, data_quality_verification) only understand V3.
+    BINARY_VERSION = BINARY_VERSION_V3
 
     # Directory Structure
     BASE_DIR = Path(__file__).parent.parent
@@ -106,11 +142,62 @@ SESSIONS_CSV = Config.SESSIONS_DIR / "sessions.csv"
 class DatabentoFetcher:
     """Fetches market data from Databento."""
 
+    # Network failures worth retrying. databento's historical client calls requests
+    # directly and lets its exceptions through; those do not derive from the builtin
+    # ConnectionError / TimeoutError.
+    TRANSIENT_ERRORS = (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        ConnectionError,
+        TimeoutError,
+    )
+
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or Config.DATABENTO_API_KEY
         if not self.api_key:
             raise ValueError("DATABENTO_API_KEY not found")
+        # Imported here so runs with nothing to fetch skip the databento import
+        import databento as db
         self.client = db.Historical(self.api_key)
+        self._http_error = db.BentoHttpError
+
+    def get_range(self, notes: Optional[List[str]] = None, **params):
+        """Call timeseries.get_range, retrying rate limits and transient errors.
+
+        Waits honor a Retry-After header when the server sends one, otherwise back
+        off exponentially with jitter. Retry messages are appended to ``notes``.
+        """
+        for attempt in range(Config.DATABENTO_MAX_RETRIES + 1):
+            try:
+                return self.client.timeseries.get_range(**params)
+            except (self._http_error, *self.TRANSIENT_ERRORS) as e:
+                if attempt == Config.DATABENTO_MAX_RETRIES or not self._is_transient(e):
+                    raise
+                delay = self._retry_delay(e, attempt)
+                if notes is not None:
+                    notes.append(f"  [RETRY] {params.get('dataset')}: {e} "
+                                 f"(attempt {attempt + 1}, waiting {delay:.1f}s)")
+                time.sleep(delay)
+
+    @classmethod
+    def _is_transient(cls, error: Exception) -> bool:
+        status = getattr(error, 'http_status', None)
+        if status is None:
+            return isinstance(error, cls.TRANSIENT_ERRORS)
+        return status == 429 or status >= 500
+
+    @staticmethod
+    def _retry_delay(error: Exception, attempt: int) -> float:
+        headers = getattr(error, 'headers', None) or {}
+        retry_after = headers.get('Retry-After')
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), Config.DATABENTO_RETRY_MAX_DELAY)
+            except ValueError:
+                pass
+        delay = Config.DATABENTO_RETRY_BASE_DELAY * (2 ** attempt)
+        return min(delay, Config.DATABENTO_RETRY_MAX_DELAY) * random.uniform(0.5, 1.0)
 
 
 # ============================================================================
@@ -120,6 +207,10 @@ class DatabentoFetcher:
 class NBBOResampler:
     """Resamples multi-exchange tick data to NBBO at fixed intervals."""
 
+    # Output field -> MBP-1 column, in the column order of the wide exchange frame
+    QUOTE_FIELDS = {'ask': 'ask_px_00', 'ask_size': 'ask_sz_00',
+                    'bid': 'bid_px_00', 'bid_size': 'bid_sz_00'}
+
     def __init__(self, interval_ms: int = None):
         self.interval_ms = interval_ms or Config.NBBO_RESAMPLE_INTERVAL_MS
 
@@ -127,109 +218,80 @@ class NBBOResampler:
         """Resample a single MBP-1 parquet file to NBBO with exchange snapshots."""
         print(f"Processing {parquet_file.name}...")
 
-        df = pd.read_parquet(parquet_file)
+        # Only the top-of-book columns are used; skip the rest of the MBP-1 record
+        columns = ['ts_event', 'publisher_id', 'bid_px_00', 'ask_px_00', 'bid_sz_00', 'ask_sz_00']
+        reader = pq.ParquetFile(parquet_file)
 
-        if df.empty:
+        if reader.metadata.num_rows == 0:
             print(f"  [WARNING] Empty file, skipping")
             return pd.DataFrame(), {}
 
-        if not pd.api.types.is_datetime64_any_dtype(df['ts_event']):
-            df['ts_event'] = pd.to_datetime(df['ts_event'], utc=True)
-        else:
-            df['ts_event'] = pd.to_datetime(df['ts_event'], utc=True)
-
-        df = df.sort_values('ts_event').reset_index(drop=True)
-
-        publishers = sorted(df['publisher_id'].unique())
+        # 1) Last quote per bin / publisher, folded batch by batch into wide
+        #    (time_bin x publisher) matrices, so only one row batch is in memory.
+        #    That needs ticks in time order; otherwise sort the file once and redo.
+        scan = self._scan_batches(reader.iter_batches(batch_size=Config.RESAMPLE_BATCH_SIZE,
+                                                      columns=columns))
+        if scan is None:
+            table = reader.read(columns=columns)
+            order = np.argsort(self._timestamps_ns(table['ts_event']), kind='stable')
+            scan = self._scan_batches([table.take(order)])
+            del table
+
+        publishers = scan['publishers']
         publisher_map = {pub_id: idx for idx, pub_id in enumerate(publishers)}
+        fields = scan['fields']
 
-        original_tick_count = len(df)
+        original_tick_count = scan['ticks']
         print(f"  Publishers: {publishers}")
         print(f"  Original ticks: {original_tick_count:,}")
 
-        start_time = df['ts_event'].iloc[0]
-        end_time = df['ts_event'].iloc[-1]
+        start_time = pd.Timestamp(scan['first_ns'], tz='UTC')
+        end_time = pd.Timestamp(scan['last_ns'], tz='UTC')
 
-        bins = pd.date_range(start=start_time.floor(f'{self.interval_ms}ms'),
-                            end=end_time.ceil(f'{self.interval_ms}ms'),
-                            freq=f'{self.interval_ms}ms')
+        # Bin edges from floor(start) to ceil(end), counted without building them
+        interval_ns = self.interval_ms * 1_000_000
+        origin_ns = scan['origin_ns']
+        num_edges = (-(-scan['last_ns'] // interval_ns) * interval_ns - origin_ns) // interval_ns + 1
 
         print(f"  Time range: {start_time} to {end_time}")
-        print(f"  Resampling bins: {len(bins):,}")
-
-        df['time_bin'] = pd.cut(df['ts_event'], bins=bins, labels=False, include_lowest=True)
-        df = df[df['time_bin'].notna()].copy()
-
-        if df.empty:
-            print(f"  [WARNING] No data in time bins")
+        print(f"  Resampling bins: {num_edges:,}")
+
+        # 2) Only two-sided quotes count; publishers that never had one are dropped
+        valid = (fields['bid'] > 0) & (fields['ask'] > 0)
+        for matrix in fields.values():
+            matrix[~valid] = np.nan
+        quoted = valid.any(axis=0)
+        if not quoted.any():
+            print(f"  [WARNING] No two-sided quotes, skipping")
             return pd.DataFrame(), {}
+        ex_pubs = np.asarray(publishers)[quoted]
 
-        # 1) Agrégation par bin / publisher comme tu le fais
-        grouped = df.groupby(['time_bin', 'publisher_id']).last()
-        grouped['bid'] = grouped['bid_px_00']
-        grouped['ask'] = grouped['ask_px_00']
-        grouped['bid_size'] = grouped['bid_sz_00']
-        grouped['ask_size'] = grouped['ask_sz_00']
-        grouped = grouped[(grouped['bid'] > 0) & (grouped['ask'] > 0)]
-
-        # 2) Pivot wide: time_bin x publisher_id
-        ex_wide = grouped.pivot_table(
-            index='time_bin',
-            columns='publisher_id',
-            values=['bid', 'ask', 'bid_size', 'ask_size'],
-            aggfunc='last'
-        ).sort_index()
-
-        # 3) Reindex sur tous les bins et ffill l’état (stateful)
-        all_bins = range(int(df['time_bin'].min()), int(df['time_bin'].max()) + 1)
-        ex_wide = ex_wide.reindex(all_bins).ffill()
+        # 3) Ffill l’état (stateful) sur tous les bins
+        ex_wide = {name: self._ffill(matrix[:, quoted]) for name, matrix in fields.items()}
 
         # 4) NBBO à partir de cet état
-        bid_matrix = ex_wide['bid']
-        ask_matrix = ex_wide['ask']
-        bid_size_matrix = ex_wide['bid_size']
-        ask_size_matrix = ex_wide['ask_size']
-
-        # Get best bid (highest) and best ask (lowest)
-        nbbo_bid = bid_matrix.max(axis=1, skipna=True)
-        nbbo_bid_pub = bid_matrix.idxmax(axis=1, skipna=True)  # publisher_id
-        nbbo_ask = ask_matrix.min(axis=1, skipna=True)
-        nbbo_ask_pub = ask_matrix.idxmin(axis=1, skipna=True)
-
-        # Get corresponding sizes for best bid/ask
-        # For each row, get the size from the publisher that had the best bid/ask
-        nbbo_bid_size = pd.Series([
-            bid_size_matrix.loc[idx, pub] if pd.notna(pub) else 0
-            for idx, pub in zip(bid_size_matrix.index, nbbo_bid_pub)
-        ], index=bid_size_matrix.index)
-        
-        nbbo_ask_size = pd.Series([
-            ask_size_matrix.loc[idx, pub] if pd.notna(pub) else 0
-            for idx, pub in zip(ask_size_matrix.index, nbbo_ask_pub)
-        ], index=ask_size_matrix.index)
-
-        nbbo = pd.DataFrame({
-            'time_bin': ex_wide.index,
+        # Best bid (highest) and best ask (lowest) with the size and publisher_id of
+        # the exchange quoting it, from one nanargmax / nanargmin per side
+        nbbo_bid, nbbo_bid_size, nbbo_bid_pub = self._best_quote(
+            ex_wide['bid'], ex_wide['bid_size'], ex_pubs, np.nanargmax)
+        nbbo_ask, nbbo_ask_size, nbbo_ask_pub = self._best_quote(
+            ex_wide['ask'], ex_wide['ask_size'], ex_pubs, np.nanargmin)
+
+        n_bins = len(nbbo_bid)
+        columns = {
+            'timestamp': pd.to_datetime(origin_ns + np.arange(n_bins) * interval_ns, utc=True),
             'nbbo_bid': nbbo_bid,
-            'nbbo_bid_size': nbbo_bid_size,
-            'nbbo_bid_publisher': nbbo_bid_pub,
             'nbbo_ask': nbbo_ask,
+            'nbbo_bid_size': nbbo_bid_size,
             'nbbo_ask_size': nbbo_ask_size,
+            'nbbo_bid_publisher': nbbo_bid_pub,
             'nbbo_ask_publisher': nbbo_ask_pub,
-        })
-        nbbo['timestamp'] = bins[nbbo['time_bin'].astype(int)]
-
-        # Exchange snapshots from the stateful wide format (already ffilled)
-        # Rename columns to match expected format: ex_{publisher_id}_{field}
-        exchange_data = ex_wide.copy()
-        exchange_data.columns = [f'ex_{col[1]}_{col[0]}' for col in exchange_data.columns]
-
-        resampled_df = nbbo.join(exchange_data).reset_index(drop=True)
-
-        nbbo_cols = ['timestamp', 'nbbo_bid', 'nbbo_ask', 'nbbo_bid_size', 'nbbo_ask_size',
-                     'nbbo_bid_publisher', 'nbbo_ask_publisher']
-        exchange_cols = [col for col in resampled_df.columns if col.startswith('ex_')]
-        resampled_df = resampled_df[nbbo_cols + exchange_cols]
+        }
+        # Exchange snapshots straight from the stateful matrices: ex_{publisher_id}_{field}
+        for name, matrix in ex_wide.items():
+            for col, pub_id in enumerate(ex_pubs):
+                columns[f'ex_{pub_id}_{name}'] = matrix[:, col]
+        resampled_df = pd.DataFrame(columns)
 
         print(f"  Resampled ticks: {len(resampled_df):,}")
         print(f"  Reduction: {100 * (1 - len(resampled_df) / original_tick_count):.1f}%")
@@ -271,27 +333,139 @@ class NBBOResampler:
 
         return resampled_df, metadata
 
+    def _scan_batches(self, batches) -> Optional[Dict]:
+        """Fold time-ordered MBP-1 batches into last-quote (time_bin x publisher) matrices.
+
+        Each field keeps the last non-NaN value per cell. Bins are right-closed like
+        pd.cut(include_lowest=True): a tick exactly on a boundary belongs to the bin
+        ending there. Returns None as soon as a batch goes back in time.
+        """
+        interval_ns = self.interval_ms * 1_000_000
+        origin = first_ns = last_ns = None
+        ticks = 0
+        pub_ids: List = []   # matrix column order (first appearance)
+        fields = {name: np.empty((0, 0)) for name in self.QUOTE_FIELDS}
+
+        for batch in batches:
+            if batch.num_rows == 0:
+                continue
+            ts = self._timestamps_ns(batch.column('ts_event'))
+            if (last_ns is not None and ts[0] < last_ns) or np.any(ts[1:] < ts[:-1]):
+                return None
+            if origin is None:
+                first_ns = int(ts[0])
+                origin = first_ns // interval_ns * interval_ns
+            last_ns = int(ts[-1])
+            ticks += batch.num_rows
+
+            time_bin = np.maximum((ts - origin - 1) // interval_ns, 0)
+            publisher = batch.column('publisher_id').to_numpy(zero_copy_only=False)
+            pub_ids += [pub_id for pub_id in np.unique(publisher) if pub_id not in pub_ids]
+            known = np.array(pub_ids)
+            sorter = np.argsort(known)
+            col = sorter[np.searchsorted(known, publisher, sorter=sorter)]
+
+            lo, hi = int(time_bin[0]), int(time_bin[-1]) + 1
+            for name in fields:
+                fields[name] = self._grow(fields[name], hi, len(pub_ids))
+            cells = (time_bin - lo) * len(pub_ids) + col
+
+            for name, source in self.QUOTE_FIELDS.items():
+                values = batch.column(source).to_numpy(zero_copy_only=False).astype(np.float64)
+                present = ~np.isnan(values)
+                last_row = np.full((hi - lo) * len(pub_ids), -1, dtype=np.int64)
+                np.maximum.at(last_row, cells[present], np.flatnonzero(present))
+                hit = last_row >= 0
+                block = fields[name][lo:hi].reshape(-1)
+                block[hit] = values[last_row[hit]]
+
+        n_bins = int(max((last_ns - origin - 1) // interval_ns, 0)) + 1
+        order = np.argsort(pub_ids)
+        return {
+            'publishers': [pub_ids[i] for i in order],
+            'fields': {name: matrix[:n_bins, order] for name, matrix in fields.items()},
+            'ticks': ticks,
+            'origin_ns': origin,
+            'first_ns': first_ns,
+            'last_ns': last_ns,
+        }
+
+    @staticmethod
+    def _grow(matrix: np.ndarray, n_rows: int, n_cols: int) -> np.ndarray:
+        """Return matrix with at least n_rows rows (doubling) and exactly n_cols columns, NaN-padded."""
+        rows, cols = matrix.shape
+        if rows >= n_rows and cols == n_cols:
+            return matrix
+        grown = np.full((max(n_rows, 2 * rows), n_cols), np.nan)
+        grown[:rows, :cols] = matrix
+        return grown
+
+    @staticmethod
+    def _timestamps_ns(column) -> np.ndarray:
+        """int64 UTC nanoseconds of an Arrow ts_event column."""
+        if pa.types.is_timestamp(column.type):
+            return column.to_numpy().astype('datetime64[ns]').view('i8')
+        return pd.to_datetime(column.to_pandas(), utc=True).to_numpy(dtype='datetime64[ns]').view('i8')
+
+    @staticmethod
+    def _ffill(matrix: np.ndarray) -> np.ndarray:
+        """Forward-fill NaNs down each column of a (bins x publishers) matrix."""
+        rows = np.where(np.isnan(matrix), 0, np.arange(len(matrix))[:, None])
+        np.maximum.accumulate(rows, axis=0, out=rows)
+        return np.take_along_axis(matrix, rows, axis=0)
+
+    @staticmethod
+    def _best_quote(prices: np.ndarray, sizes: np.ndarray, publishers: np.ndarray,
+                    pick) -> Tuple[np.ndarray, np.ndarray, pd.Series]:
+        """Best price per row with its size and publisher (NaN / 0 / NaN where nobody quotes)."""
+        has_quote = ~np.isnan(prices).all(axis=1)
+        best = np.zeros(len(prices), dtype=np.intp)
+        best[has_quote] = pick(prices[has_quote], axis=1)
+        rows = np.arange(len(prices))
+        price = np.where(has_quote, prices[rows, best], np.nan)
+        size = np.where(has_quote, sizes[rows, best], 0)
+        publisher = pd.Series(publishers[best]).where(has_quote)
+        return price, size, publisher
+
 
 # ============================================================================
 # Binary Compressor
 # ============================================================================
 
 class NBBOBinaryCompressor:
-    """Compresses NBBO resampled data to custom binary format (Version 3)."""
+    """Compresses NBBO resampled data to custom binary format (Version 3 or 4).
 
-    def __init__(self):
+    Version 3 writes one variable-length record per sample. Version 4 writes the
+    same fields column by column, so near-constant values (publisher indexes,
+    sizes, quiet exchanges) sit next to each other and gzip much better.
+    """
+
+    def __init__(self, version: int = None):
         self.price_scale = Config.PRICE_SCALE
         self.size_scale = Config.SIZE_SCALE
         self.time_unit = Config.TIME_UNIT
+        self.version = version or Config.BINARY_VERSION
 
     def compress_file(self, parquet_file: Path, output_dir: Path, publisher_map: dict) -> Dict:
-        """Compress a single NBBO parquet file to binary format Version 3."""
-        df = pd.read_parquet(parquet_file)
+        """Compress a single NBBO parquet file to the configured binary format version."""
+        # Only read the columns the encoder uses (pushdown into the parquet reader)
+        columns = ['timestamp', 'nbbo_bid', 'nbbo_ask', 'nbbo_bid_size', 'nbbo_ask_size',
+                   'nbbo_bid_publisher', 'nbbo_ask_publisher']
+        for pub_id in publisher_map:
+            columns += [f'ex_{pub_id}_bid', f'ex_{pub_id}_ask',
+                        f'ex_{pub_id}_bid_size', f'ex_{pub_id}_ask_size']
+        available_cols = set(pq.read_schema(parquet_file).names)
+        table = pq.read_table(parquet_file, columns=[c for c in columns if c in available_cols])
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
+        del table
 
         if df.empty:
             raise ValueError("Empty DataFrame")
 
-        df = df.sort_values('timestamp').reset_index(drop=True)
+        # Sort on the int64 timestamps only and permute once, instead of sort_values
+        ts_i64 = df['timestamp'].to_numpy(dtype='datetime64[ns]').view('i8')
+        order = np.argsort(ts_i64, kind='stable')
+        df = df.take(order).reset_index(drop=True)
 
         t0 = df['timestamp'].iloc[0]
         initial_timestamp_us = int(t0.timestamp() * self.time_unit)
@@ -299,81 +473,40 @@ class NBBOBinaryCompressor:
         publisher_map_str = ','.join([f"{idx}:{pub_id}" for pub_id, idx in publisher_map.items()])
         publisher_map_bytes = publisher_map_str.encode('utf-8')
 
-        publisher_id_to_idx = {pub_id: idx for pub_id, idx in publisher_map.items()}
-
         num_samples = len(df)
-        buffer = bytearray()
 
-        header = struct.pack(
+        # Size the output up front and fill it in place rather than growing a bytearray
+        header_size = struct.calcsize('<4sHHIQ')
+        body_offset = header_size + 2 + len(publisher_map_bytes)
+        if self.version == Config.BINARY_VERSION_V4:
+            columns = self._encode_columns_v4(df, publisher_map)
+            body_size = sum(column.nbytes for column in columns)
+        else:
+            body_size = self._rows_v3_size(df, publisher_map)
+        buffer = bytearray(body_offset + body_size)
+
+        struct.pack_into(
             '<4sHHIQ',
+            buffer,
+            0,
             Config.BINARY_MAGIC,
-            Config.BINARY_VERSION_V3,
+            self.version,
             Config.NBBO_RESAMPLE_INTERVAL_MS,
             num_samples,
             initial_timestamp_us
         )
-        buffer.extend(header)
-
-        buffer.extend(struct.pack('<H', len(publisher_map_bytes)))
-        buffer.extend(publisher_map_bytes)
-
-        prev_timestamp_ms = int(t0.timestamp() * 1000)
-
-        for i in range(num_samples):
-            row = df.iloc[i]
-
-            current_timestamp_ms = int(row['timestamp'].timestamp() * 1000)
-            time_delta_ms = current_timestamp_ms - prev_timestamp_ms
-            prev_timestamp_ms = current_timestamp_ms
-
-            nbbo_bid = int(row['nbbo_bid'] * self.price_scale)
-            nbbo_ask = int(row['nbbo_ask'] * self.price_scale)
-            nbbo_bid_size = int(row['nbbo_bid_size'] * self.size_scale)
-            nbbo_ask_size = int(row['nbbo_ask_size'] * self.size_scale)
-            best_bid_pub = publisher_id_to_idx.get(row['nbbo_bid_publisher'], 0)
-            best_ask_pub = publisher_id_to_idx.get(row['nbbo_ask_publisher'], 0)
-
-            nbbo_data = struct.pack(
-                '<iiiiiBB',
-                time_delta_ms,
-                nbbo_bid,
-                nbbo_ask,
-                nbbo_bid_size,
-                nbbo_ask_size,
-                best_bid_pub,
-                best_ask_pub
-            )
-            buffer.extend(nbbo_data)
-
-            exchanges_data = []
-            for pub_id, pub_idx in publisher_map.items():
-                bid_col = f'ex_{pub_id}_bid'
-                ask_col = f'ex_{pub_id}_ask'
-                bid_size_col = f'ex_{pub_id}_bid_size'
-                ask_size_col = f'ex_{pub_id}_ask_size'
-
-                if bid_col in row.index and not pd.isna(row[bid_col]):
-                    bid = int(row[bid_col] * self.price_scale)
-                    ask = int(row[ask_col] * self.price_scale)
-                    bid_size = int(row[bid_size_col] * self.size_scale)
-                    ask_size = int(row[ask_size_col] * self.size_scale)
-
-                    exchanges_data.append((pub_idx, bid, ask, bid_size, ask_size))
-
-            buffer.extend(struct.pack('<B', len(exchanges_data)))
-
-            for pub_idx, bid, ask, bid_size, ask_size in exchanges_data:
-                exchange_data = struct.pack(
-                    '<BiiII',
-                    pub_idx,
-                    bid,
-                    ask,
-                    bid_size,
-                    ask_size
-                )
-                buffer.extend(exchange_data)
-
-        compressed = gzip.compress(bytes(buffer), compresslevel=Config.GZIP_LEVEL)
+        struct.pack_into('<H', buffer, header_size, len(publisher_map_bytes))
+        buffer[header_size + 2:body_offset] = publisher_map_bytes
+
+        if self.version == Config.BINARY_VERSION_V4:
+            out = np.frombuffer(buffer, dtype=np.uint8)
+            offset = body_offset
+            for column in columns:
+                out[offset:offset + column.nbytes] = column.view(np.uint8)
+                offset += column.nbytes
+            del out
+        else:
+            self._encode_rows_v3(df, publisher_map, buffer, body_offset)
 
         filename = parquet_file.stem
         symbol = filename.split('_')[0]
@@ -382,8 +515,20 @@ class NBBOBinaryCompressor:
         output_dir.mkdir(parents=True, exist_ok=True)
         dest_file = output_dir / f"{symbol}-{date_str}.bin.gz"
 
+        # Compress straight from a view of the buffer and stream the gzip members to disk,
+        # avoiding a bytes() copy and a second full-size compressed buffer
+        compressor = zlib.compressobj(Config.GZIP_LEVEL, zlib.DEFLATED, 31)
+        view = memoryview(buffer)
+        compressed_size = 0
         with open(dest_file, 'wb') as f:
-            f.write(compressed)
+            for start in range(0, len(view), Config.GZIP_CHUNK_SIZE):
+                chunk = compressor.compress(view[start:start + Config.GZIP_CHUNK_SIZE])
+                f.write(chunk)
+                compressed_size += len(chunk)
+            chunk = compressor.flush()
+            f.write(chunk)
+            compressed_size += len(chunk)
+        view.release()
 
         stats = {
             'symbol': symbol,
@@ -392,13 +537,152 @@ class NBBOBinaryCompressor:
             'output_file': str(dest_file),
             'num_rows': num_samples,
             'original_size_mb': len(buffer) / (1024 * 1024),
-            'compressed_size_mb': len(compressed) / (1024 * 1024),
-            'compression_ratio': len(buffer) / len(compressed),
-            'compression_pct': (len(compressed) / len(buffer)) * 100
+            'compressed_size_mb': compressed_size / (1024 * 1024),
+            'compression_ratio': len(buffer) / compressed_size,
+            'compression_pct': (compressed_size / len(buffer)) * 100
         }
 
         return stats
 
+    @staticmethod
+    def _time_deltas_ms(df: pd.DataFrame) -> np.ndarray:
+        """Millisecond deltas between consecutive samples (first is 0), as int32."""
+        ts_ms = df['timestamp'].to_numpy(dtype='datetime64[ns]').view('i8') // 1_000_000
+        time_deltas_ms = np.zeros(len(ts_ms), dtype='<i4')
+        time_deltas_ms[1:] = np.diff(ts_ms)
+        return time_deltas_ms
+
+    @staticmethod
+    def _exchange_presence(df: pd.DataFrame, publisher_map: dict) -> np.ndarray:
+        """Boolean (num_samples, num_publishers) matrix of which exchanges have a quote."""
+        present = np.zeros((len(df), len(publisher_map)), dtype=bool)
+        for j, pub_id in enumerate(publisher_map):
+            bid_col = f'ex_{pub_id}_bid'
+            if bid_col in df.columns:
+                present[:, j] = df[bid_col].notna().to_numpy()
+        return present
+
+    @staticmethod
+    def _scatter(out: np.ndarray, positions: np.ndarray, values: np.ndarray, dtype: str):
+        """Write values as little-endian dtype into out at the given byte positions."""
+        raw = np.ascontiguousarray(values.astype(dtype)).view(np.uint8).reshape(len(values), -1)
+        out[positions[:, None] + np.arange(raw.shape[1])] = raw
+
+    def _rows_v3_size(self, df: pd.DataFrame, publisher_map: dict) -> int:
+        """Number of bytes _encode_rows_v3 writes for this frame."""
+        num_quotes = int(self._exchange_presence(df, publisher_map).sum())
+        return len(df) * 23 + num_quotes * 17
+
+    def _encode_rows_v3(self, df: pd.DataFrame, publisher_map: dict, buffer: bytearray, offset: int):
+        """Write one record per sample at offset: time delta, NBBO, then the quoting exchanges.
+
+        Records are variable length ('<iiiiiBB', an exchange count byte, then one
+        '<BiiII' entry per quoting exchange), so each field is scattered to its
+        computed byte positions rather than packed sample by sample.
+        """
+        out = np.frombuffer(buffer, dtype=np.uint8)
+        present = self._exchange_presence(df, publisher_map)
+        num_exchanges = present.sum(axis=1)
+
+        record_sizes = 23 + 17 * num_exchanges
+        starts = offset + np.concatenate(([0], np.cumsum(record_sizes)[:-1]))
+
+        nbbo_fields = [
+            (0, self._time_deltas_ms(df), '<i4'),
+            (4, df['nbbo_bid'].to_numpy(dtype=np.float64) * self.price_scale, '<i4'),
+            (8, df['nbbo_ask'].to_numpy(dtype=np.float64) * self.price_scale, '<i4'),
+            (12, df['nbbo_bid_size'].to_numpy(dtype=np.float64) * self.size_scale, '<i4'),
+            (16, df['nbbo_ask_size'].to_numpy(dtype=np.float64) * self.size_scale, '<i4'),
+            (20, df['nbbo_bid_publisher'].map(publisher_map).fillna(0).to_numpy(), 'u1'),
+            (21, df['nbbo_ask_publisher'].map(publisher_map).fillna(0).to_numpy(), 'u1'),
+            (22, num_exchanges, 'u1'),
+        ]
+        for field_offset, values, dtype in nbbo_fields:
+            # Float -> int64 first to truncate toward zero like int() did
+            self._scatter(out, starts + field_offset, values.astype(np.int64), dtype)
+
+        # Exchange entries in (sample, publisher) order; rank is the slot within the record
+        rows, cols = np.nonzero(present)
+        if rows.size == 0:
+            return
+        rank = (np.cumsum(present, axis=1) - 1)[rows, cols]
+        entry_starts = starts[rows] + 23 + 17 * rank
+
+        pub_ids = list(publisher_map)
+        pub_indexes = np.array([publisher_map[pub_id] for pub_id in pub_ids], dtype=np.int64)
+        self._scatter(out, entry_starts, pub_indexes[cols], 'u1')
+
+        exchange_fields = [(1, 'bid', self.price_scale, '<i4'), (5, 'ask', self.price_scale, '<i4'),
+                           (9, 'bid_size', self.size_scale, '<u4'), (13, 'ask_size', self.size_scale, '<u4')]
+        for field_offset, field, scale, dtype in exchange_fields:
+            matrix = np.column_stack([
+                df[f'ex_{pub_id}_{field}'].to_numpy(dtype=np.float64, na_value=0.0)
+                if f'ex_{pub_id}_{field}' in df.columns else np.zeros(len(df))
+                for pub_id in pub_ids
+            ])
+            values = (matrix[rows, cols] * scale).astype(np.int64)
+            self._scatter(out, entry_starts + field_offset, values, dtype)
+
+    def _encode_columns_v4(self, df: pd.DataFrame, publisher_map: dict) -> List[np.ndarray]:
+        """Encode each field as a contiguous little-endian array of num_samples values.
+
+        Column order: time_delta_ms, nbbo_bid, nbbo_ask, nbbo_bid_size, nbbo_ask_size
+        (int32), best_bid_pub, best_ask_pub (uint8), then for each publisher index in
+        order: present (uint8), bid, ask (int32), bid_size, ask_size (uint32).
+
+        Price columns (NBBO and per-exchange bid/ask) are stored as deltas from the
+        previous sample, the first one relative to zero. Exchanges without a quote in
+        a sample have present=0, zeroed sizes and a repeated price (delta 0).
+        """
+        num_samples = len(df)
+
+        columns = [self._time_deltas_ms(df)]
+        for col in ['nbbo_bid', 'nbbo_ask']:
+            prices = (df[col].to_numpy(dtype=np.float64) * self.price_scale).astype(np.int64)
+            columns.append(np.diff(prices, prepend=0).astype('<i4'))
+        for col in ['nbbo_bid_size', 'nbbo_ask_size']:
+            columns.append((df[col].to_numpy(dtype=np.float64) * self.size_scale).astype('<i4'))
+        for col in ['nbbo_bid_publisher', 'nbbo_ask_publisher']:
+            columns.append(df[col].map(publisher_map).fillna(0).to_numpy(dtype='u1'))
+
+        # Pull each exchange's fields out of the frame here; the pool only touches NumPy
+        exchange_fields = []
+        for pub_id, _ in sorted(publisher_map.items(), key=lambda item: item[1]):
+            exchange_fields.append([
+                df[col].to_numpy(dtype=np.float64, na_value=np.nan) if col in df.columns
+                else np.full(num_samples, np.nan)
+                for col in [f'ex_{pub_id}_bid', f'ex_{pub_id}_ask',
+                            f'ex_{pub_id}_bid_size', f'ex_{pub_id}_ask_size']
+            ])
+
+        # Exchanges encode independently and NumPy releases the GIL, so spread them
+        # over threads; map() keeps the publisher order
+        max_workers = min(Config.ENCODE_WORKERS, len(exchange_fields)) or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for exchange_columns in executor.map(lambda fields: self._encode_exchange_v4(*fields),
+                                                 exchange_fields):
+                columns.extend(exchange_columns)
+
+        return columns
+
+    def _encode_exchange_v4(self, bid: np.ndarray, ask: np.ndarray,
+                            bid_size: np.ndarray, ask_size: np.ndarray) -> List[np.ndarray]:
+        """Encode one exchange's present, bid, ask, bid_size and ask_size columns."""
+        present = ~np.isnan(bid)
+        columns = [present.astype('u1')]
+
+        # Carry the last quoted price through gaps so they encode as zero deltas
+        last_quote = np.maximum.accumulate(np.where(present, np.arange(len(bid)), -1))
+        for prices in [bid, ask]:
+            filled = np.where(last_quote >= 0, prices[np.maximum(last_quote, 0)], 0.0)
+            filled = (np.nan_to_num(filled) * self.price_scale).astype(np.int64)
+            columns.append(np.diff(filled, prepend=0).astype('<i4'))
+        for sizes in [bid_size, ask_size]:
+            sizes = np.nan_to_num(sizes) * self.size_scale
+            columns.append(np.where(present, sizes, 0).astype('<u4'))
+
+        return columns
+
 
 # ============================================================================
 # Session Processing Functions
@@ -483,6 +767,128 @@ def find_missing_sessions(sessions_df, existing):
     return missing
 
 
+def _dbn_records_to_table(records: np.ndarray, symbol: str,
+                          publisher_id: Optional[int] = None) -> pa.Table:
+    """Convert a batch of DBN MBP-1 records to an Arrow table shaped like DBNStore.to_df().
+
+    Timestamps become UTC timestamps, fixed-point prices become floats (undefined
+    prices become NaN), character fields become strings and a symbol column is
+    appended. The record length header and ts_recv (the to_df() index) are dropped.
+    When publisher_id is given it replaces the records' own IDs; the records are
+    never modified (DBNStore.to_ndarray() batches are read-only buffers).
+    """
+    names = ['ts_event'] + [name for name in records.dtype.names
+                            if name not in ('length', 'ts_recv', 'ts_event')]
+    arrays = []
+    for name in names:
+        values = records[name]
+        if name == 'ts_event':
+            array = pa.array(values.view('i8')).cast(pa.timestamp('ns', tz='UTC'))
+        elif name == 'publisher_id' and publisher_id is not None:
+            array = pa.array(np.full(len(records), publisher_id, dtype=values.dtype))
+        elif name == 'price' or '_px_' in name:
+            prices = values.astype(np.float64)
+            prices[values == Config.DBN_UNDEF_PRICE] = np.nan
+            array = pa.array(prices / Config.DBN_PRICE_SCALE)
+        elif values.dtype.kind == 'S':
+            array = pa.array(values.astype('U'))
+        else:
+            array = pa.array(values)
+        arrays.append(array)
+
+    arrays.append(pa.array(np.full(len(records), symbol, dtype=object), type=pa.string()))
+    return pa.Table.from_arrays(arrays, names=names + ['symbol'])
+
+
+def _fetch_dataset_mbp1(fetcher, dataset, symbol, start_date, end_date, output_path):
+    """Fetch one exchange's MBP-1 data into a parquet part; returns (path or None, report lines).
+
+    The DBN response is converted and written in record batches straight from its
+    NumPy records to Arrow, so only one batch is held in memory at a time and no
+    pandas frame is built.
+    """
+    lines = []
+    part_file = output_path / f"{symbol}_{dataset}_part.parquet"
+    writer = None
+    num_quotes = 0
+    pub_ids_original = set()
+    correct_pub_id = Config.DATASET_TO_PUBLISHER_ID.get(dataset)
+
+    try:
+        data = fetcher.get_range(
+            notes=lines,
+            dataset=dataset,
+            symbols=[symbol],
+            schema='mbp-1',
+            start=start_date.isoformat(),
+            end=end_date.isoformat(),
+            stype_in='raw_symbol',
+        )
+
+        for records in data.to_ndarray(count=Config.DBN_BATCH_SIZE):
+            if len(records) == 0:
+                continue
+
+            pub_ids_original.update(np.unique(records['publisher_id']).tolist())
+            # Remap to standard Databento publisher IDs (done on the Arrow side)
+            table = _dbn_records_to_table(records, symbol, publisher_id=correct_pub_id)
+            if writer is None:
+                writer = pq.ParquetWriter(part_file, table.schema,
+                                          compression=Config.PARQUET_COMPRESSION,
+                                          compression_level=Config.PARQUET_COMPRESSION_LEVEL)
+            writer.write_table(table, row_group_size=Config.PARQUET_ROW_GROUP_SIZE)
+            num_quotes += len(records)
+
+    except Exception as e:
+        lines.append(f"  [ERROR] Failed to fetch from {dataset}: {e}")
+        return None, lines
+
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if num_quotes == 0:
+        lines.append(f"  [WARNING] No data from {dataset}")
+        return None, lines
+
+    lines.append(f"  [SUCCESS] {num_quotes:,} quotes from {dataset}")
+
+    if pub_ids_original:
+        lines.append(f"  Original Publisher IDs: {sorted(pub_ids_original)}")
+        if correct_pub_id is not None:
+            lines.append(f"  Remapped to Publisher ID: {correct_pub_id}")
+        else:
+            lines.append(f"  [WARNING] No mapping found for {dataset}, keeping original IDs")
+
+    return part_file, lines
+
+
+def _drop_repeated_quotes(table: pa.Table) -> Tuple[pa.Table, int]:
+    """Drop rows that repeat the previous row's top of book for the same publisher and timestamp.
+
+    Expects the table ordered by (ts_event, publisher_id). Only back-to-back repeats are
+    removed, so the last quote state seen per publisher and time bin is unchanged.
+    """
+    columns = [c for c in Config.QUOTE_DEDUP_COLUMNS if c in table.column_names]
+    if table.num_rows < 2 or len(columns) < len(Config.QUOTE_DEDUP_COLUMNS):
+        return table, 0
+
+    repeated = np.ones(table.num_rows - 1, dtype=bool)
+    for name in columns:
+        values = table[name].to_numpy()
+        if values.dtype.kind == 'M':
+            values = values.view('i8')
+        same = values[1:] == values[:-1]
+        if values.dtype.kind == 'f':
+            same |= np.isnan(values[1:]) & np.isnan(values[:-1])
+        repeated &= same
+
+    if not repeated.any():
+        return table, 0
+    keep = np.concatenate(([True], ~repeated))
+    return table.filter(pa.array(keep)), int(repeated.sum())
+
+
 def fetch_mbp1_multi_exchange(fetcher, symbol, start_date, end_date, output_dir):
     """Fetch MBP-1 data from multiple exchanges."""
     print(f"\n{'='*80}")
@@ -500,48 +906,27 @@ def fetch_mbp1_multi_exchange(fetcher, symbol, start_date, end_date, output_dir)
     output_path = output_dir / start_str
     output_path.mkdir(parents=True, exist_ok=True)
 
-    all_data = []
-
-    for i, dataset in enumerate(Config.DATABENTO_DATASETS_MBP1, 1):
-        print(f"\n[{i}/{len(Config.DATABENTO_DATASETS_MBP1)}] Querying {dataset}...")
-
-        try:
-            data = fetcher.client.timeseries.get_range(
-                dataset=dataset,
-                symbols=[symbol],
-                schema='mbp-1',
-                start=start_date.isoformat(),
-                end=end_date.isoformat(),
-                stype_in='raw_symbol',
-            )
-
-            df = data.to_df()
-
-            if df.empty:
-                print(f"  [WARNING] No data from {dataset}")
-                continue
+    part_files = []
 
-            print(f"  [SUCCESS] {len(df):,} quotes from {dataset}")
+    # Each exchange is a separate, I/O-bound request: issue them concurrently
+    # (bounded by DATABENTO_MAX_CONCURRENT_REQUESTS) and report in dataset order
+    datasets = Config.DATABENTO_DATASETS_MBP1
+    max_workers = min(Config.DATABENTO_MAX_CONCURRENT_REQUESTS, len(datasets))
+    print(f"\nQuerying {len(datasets)} exchanges ({max_workers} concurrent requests)...")
 
-            if 'publisher_id' in df.columns and not df.empty:
-                pub_ids_original = df['publisher_id'].unique()
-                print(f"  Original Publisher IDs: {pub_ids_original}")
-                
-                # Remap to standard Databento publisher IDs
-                if dataset in Config.DATASET_TO_PUBLISHER_ID:
-                    correct_pub_id = Config.DATASET_TO_PUBLISHER_ID[dataset]
-                    df['publisher_id'] = correct_pub_id
-                    print(f"  Remapped to Publisher ID: {correct_pub_id}")
-                else:
-                    print(f"  [WARNING] No mapping found for {dataset}, keeping original IDs")
-
-            all_data.append(df)
-
-        except Exception as e:
-            print(f"  [ERROR] Failed to fetch from {dataset}: {e}")
-            continue
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda dataset: _fetch_dataset_mbp1(
+                fetcher, dataset, symbol, start_date, end_date, output_path
+            ),
+            datasets
+        )
+        for i, (dataset, (part_file, lines)) in enumerate(zip(datasets, results), 1):
+            print("\n".join([f"\n[{i}/{len(datasets)}] {dataset}", *lines]))
+            if part_file is not None:
+                part_files.append(part_file)
 
-    if not all_data:
+    if not part_files:
         print("\n[ERROR] No data retrieved from any exchange")
         return None
 
@@ -549,19 +934,47 @@ def fetch_mbp1_multi_exchange(fetcher, symbol, start_date, end_date, output_dir)
     print("Combining Multi-Exchange Data")
     print(f"{'='*80}\n")
 
-    df_combined = pd.concat(all_data, ignore_index=True)
-    df_combined = df_combined.sort_values('ts_event').reset_index(drop=True)
-
-    print(f"Total quotes: {len(df_combined):,}")
-
-    if 'publisher_id' in df_combined.columns:
-        exchange_counts = df_combined['publisher_id'].value_counts().to_dict()
+    # Combine in Arrow: one concatenation, then a single stable sort on the int64
+    # timestamps (publisher as tie-break) applied with take(), with no pandas frame
+    # or index in between
+    combined = pa.concat_tables(
+        [pq.read_table(part) for part in part_files], promote_options='permissive'
+    )
+    for part in part_files:
+        part.unlink()
+
+    ts_i64 = combined['ts_event'].to_numpy().view('i8')
+    if 'publisher_id' in combined.column_names:
+        order = np.lexsort((combined['publisher_id'].to_numpy(), ts_i64))
+    else:
+        order = np.argsort(ts_i64, kind='stable')
+    combined = combined.take(order)
+
+    combined, duplicates = _drop_repeated_quotes(combined)
+
+    print(f"Total quotes: {combined.num_rows:,}")
+    if duplicates:
+        print(f"Repeated quotes dropped: {duplicates:,}")
+
+    if 'publisher_id' in combined.column_names:
+        exchange_counts = pc.value_counts(combined['publisher_id']).to_pylist()
         print("\nQuotes per exchange:")
-        for pub_id, count in sorted(exchange_counts.items()):
-            print(f"  Publisher {pub_id}: {count:,}")
+        for item in sorted(exchange_counts, key=lambda item: item['values']):
+            print(f"  Publisher {item['values']}: {item['counts']:,}")
+
+    # Dictionary-encode the repeated symbol string before writing
+    if 'symbol' in combined.column_names:
+        idx = combined.schema.get_field_index('symbol')
+        combined = combined.set_column(idx, 'symbol', pc.dictionary_encode(combined['symbol']))
 
     parquet_file = output_path / f"{symbol}_{start_str}_mbp1.parquet"
-    df_combined.to_parquet(parquet_file, compression='snappy')
+    pq.write_table(
+        combined.replace_schema_metadata(None),
+        parquet_file,
+        compression=Config.PARQUET_COMPRESSION,
+        compression_level=Config.PARQUET_COMPRESSION_LEVEL,
+        data_page_version='2.0',
+    )
 
     file_size_mb = parquet_file.stat().st_size / (1024 * 1024)
     print(f"\nSaved: {parquet_file}")
@@ -591,8 +1004,23 @@ def resample_to_nbbo(parquet_file, output_dir):
     output_path = output_dir / date_str
     output_path.mkdir(parents=True, exist_ok=True)
 
+    # Sizes and publisher ids as compact integers (nullable where an exchange has no
+    # quote yet). Prices stay float64: penny prices are not exact in float32, and the
+    # compressor converts them to fixed point by truncation.
+    resampled_df = resampled_df.astype({
+        'nbbo_bid_size': 'uint32', 'nbbo_ask_size': 'uint32',
+        'nbbo_bid_publisher': 'int16', 'nbbo_ask_publisher': 'int16',
+        **{col: 'UInt32' for col in resampled_df.columns
+           if col.startswith('ex_') and col.endswith('_size')},
+    })
+
     nbbo_file = output_path / f"{symbol}_{date_str}_nbbo.parquet"
-    resampled_df.to_parquet(nbbo_file, compression='snappy')
+    # Dictionary pages only pay off on the low-cardinality publisher columns; on the
+    # price/size columns they compress worse under zstd than plain encoding
+    resampled_df.to_parquet(nbbo_file,
+                            compression=Config.PARQUET_COMPRESSION,
+                            compression_level=Config.PARQUET_COMPRESSION_LEVEL,
+                            use_dictionary=['nbbo_bid_publisher', 'nbbo_ask_publisher'])
 
     print(f"Saved: {nbbo_file}")
     print(f"Samples: {len(resampled_df):,}")
@@ -606,13 +1034,14 @@ def compress_nbbo(nbbo_file, output_dir):
     print("Compressing to Binary Format")
     print(f"{'='*80}\n")
 
-    df = pd.read_parquet(nbbo_file)
-    if df.empty:
+    # Publishers are derived from the schema alone; no need to load the data here
+    parquet_meta = pq.ParquetFile(nbbo_file)
+    if parquet_meta.metadata.num_rows == 0:
         print("[ERROR] Empty NBBO file")
         return None
 
     publishers = []
-    for col in df.columns:
+    for col in parquet_meta.schema_arrow.names:
         if col.startswith('ex_') and col.endswith('_bid'):
             pub_id = int(col.split('_')[1])
             if pub_id not in publishers:
@@ -0,0 +1,92 @@
+"""Checks for script/get_sessions.py that run without a Databento account."""
+
+import importlib.util
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pyarrow.parquet as pq
+
+SCRIPT = Path(__file__).resolve().parent.parent / 'script' / 'get_sessions.py'
+spec = importlib.util.spec_from_file_location('get_sessions', SCRIPT)
+get_sessions = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(get_sessions)
+
+# DBN MBP-1 record layout (databento_dbn.MBP1Msg)
+MBP1_DTYPE = np.dtype([
+    ('length', 'u1'), ('rtype', 'u1'), ('publisher_id', 'u2'), ('instrument_id', 'u4'),
+    ('ts_event', 'u8'), ('price', 'i8'), ('size', 'u4'), ('action', 'S1'), ('side', 'S1'),
+    ('flags', 'u1'), ('depth', 'u1'), ('ts_recv', 'u8'), ('ts_in_delta', 'i4'),
+    ('sequence', 'u4'), ('bid_px_00', 'i8'), ('ask_px_00', 'i8'), ('bid_sz_00', 'u4'),
+    ('ask_sz_00', 'u4'), ('bid_ct_00', 'u4'), ('ask_ct_00', 'u4'),
+])
+
+
+class FakeStore:
+    """Stands in for DBNStore: to_ndarray() yields read-only np.frombuffer batches."""
+
+    def __init__(self, records):
+        self.records = records
+
+    def to_ndarray(self, count=None):
+        for i in range(0, len(self.records), count):
+            yield np.frombuffer(self.records[i:i + count].tobytes(), dtype=MBP1_DTYPE)
+
+
+def make_records(n, publisher_id):
+    records = np.zeros(n, dtype=MBP1_DTYPE)
+    records['publisher_id'] = publisher_id
+    records['ts_event'] = 1_763_389_800_000_000_000 + np.arange(n) * 1_000_000
+    records['bid_px_00'] = 2_000_000_000
+    records['ask_px_00'] = 2_010_000_000
+    records['ask_px_00'][0] = get_sessions.Config.DBN_UNDEF_PRICE
+    records['bid_sz_00'] = 100
+    records['action'] = b'A'
+    return records
+
+
+def test_fetch_remaps_publisher_on_read_only_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_sessions.Config, 'DBN_BATCH_SIZE', 4)
+    store = FakeStore(make_records(10, publisher_id=77))
+    fetcher = SimpleNamespace(get_range=lambda notes=None, **params: store)
+
+    part_file, lines = get_sessions._fetch_dataset_mbp1(
+        fetcher, 'XNAS.ITCH', 'TEST', datetime(2025, 11, 17), datetime(2025, 11, 18), tmp_path)
+
+    assert part_file is not None, lines
+    table = pq.read_table(part_file)
+    assert table.num_rows == 10
+    assert set(table['publisher_id'].to_pylist()) == {1}
+    assert '  Original Publisher IDs: [77]' in lines
+    assert np.isnan(table['ask_px_00'][0].as_py())
+    assert table['bid_px_00'][1].as_py() == 2.0
+    assert table['action'][0].as_py() == 'A'
+
+
+def test_get_range_retries_requests_network_errors(monkeypatch):
+    import requests
+
+    class FakeHttpError(Exception):
+        http_status = 403
+
+    outcomes = [requests.exceptions.ConnectionError('reset'),
+                requests.exceptions.ReadTimeout('slow'),
+                requests.exceptions.ChunkedEncodingError('cut'),
+                'store']
+
+    def get_range(**params):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(get_sessions.time, 'sleep', lambda seconds: None)
+    fetcher = get_sessions.DatabentoFetcher.__new__(get_sessions.DatabentoFetcher)
+    fetcher.client = SimpleNamespace(timeseries=SimpleNamespace(get_range=get_range))
+    fetcher._http_error = FakeHttpError
+
+    notes = []
+    assert fetcher.get_range(notes=notes, dataset='XNAS.ITCH') == 'store'
+    assert len(notes) == 3
+    assert not get_sessions.DatabentoFetcher._is_transient(FakeHttpError())